@@ -1,14 +1,22 @@
-import json
 import logging
 import os
-from datetime import datetime, timezone
+from collections.abc import Iterable
 from logging import INFO
+from typing import Any
 
 from graphiti_core import Graphiti
-from graphiti_core.embedder.gemini import GeminiEmbedder, GeminiEmbedderConfig
-from graphiti_core.llm_client.gemini_client import GeminiClient, LLMConfig
+from graphiti_core.embedder.gemini import GeminiEmbedderConfig
+from graphiti_core.llm_client.gemini_client import LLMConfig
 from graphiti_core.nodes import EpisodeType
-from graphiti_core.search.search_config_recipes import NODE_HYBRID_SEARCH_RRF
+
+from llm_cache import CachedGeminiClient, CachedGeminiEmbedder, ResponseCache
+from utils import (
+    EPISODES_PATH,
+    iter_episodes,
+    normalize_bodies,
+    reference_time,
+    run,
+)
 
 # Configure logging
 
@@ -32,19 +40,22 @@ async def main():
         )
 
     graphiti = None
+    response_cache = ResponseCache()
     try:
         # Initialize Graphiti with Gemini clients
         graphiti = Graphiti(
             "bolt://localhost:7687",
             "neo4j",
             "demodemo",
-            llm_client=GeminiClient(
-                config=LLMConfig(api_key=api_key, model="gemini-2.0-flash")
+            llm_client=CachedGeminiClient(
+                config=LLMConfig(api_key=api_key, model="gemini-2.0-flash"),
+                response_cache=response_cache,
             ),
-            embedder=GeminiEmbedder(
+            embedder=CachedGeminiEmbedder(
                 config=GeminiEmbedderConfig(
                     api_key=api_key, embedding_model="embedding-001"
-                )
+                ),
+                response_cache=response_cache,
             ),
         )
         logger.info("Graphiti initialized successfully")
@@ -69,7 +80,7 @@ async def main():
         raise  # Re-raise the exception after logging
 
     # Episodes list containing both text and JSON episodes
-    episodes = [
+    episodes: Iterable[dict[str, Any]] = [
         {
             "content": "Kamala Harris is the Attorney General of California. She was previously "
             "the district attorney for San Francisco.",
@@ -103,24 +114,27 @@ async def main():
         #     "description": "podcast metadata",
         # },
     ]
+    if EPISODES_PATH:
+        episodes = iter_episodes(EPISODES_PATH)
+    # Encode each body once, as the episode is read
+    episodes = normalize_bodies(episodes, "content")
 
-    # Add episodes to the graph
+    # Add episodes one at a time: unlike add_episode_bulk, add_episode runs edge
+    # invalidation and date extraction, and concurrent calls on one group would
+    # race entity resolution. The cached clients skip repeated Gemini calls and
+    # rate limit the rest.
+    now = reference_time()
     for i, episode in enumerate(episodes):
+        source = EpisodeType(episode["type"])
         await graphiti.add_episode(
             name=f"Freakonomics Radio {i}",
-            episode_body=(
-                episode["content"]
-                if isinstance(episode["content"], str)
-                else json.dumps(episode["content"])
-            ),
-            source=episode["type"],
+            episode_body=episode["content"],
+            source=source,
             source_description=episode["description"],
-            reference_time=datetime.now(timezone.utc),
+            reference_time=now,
         )
-        print(f"Added episode: Freakonomics Radio {i} ({episode['type'].value})")
+        print(f"Added episode: Freakonomics Radio {i} ({source.value})")
 
 
 if __name__ == "__main__":
-    import asyncio
-
-    asyncio.run(main())
+    run(main())
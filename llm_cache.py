@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import typing
+from collections.abc import Awaitable, Callable, Iterable
+from datetime import datetime, timezone
+from enum import Enum
+from functools import partial
+
+import orjson
+from graphiti_core.embedder.gemini import GeminiEmbedder, GeminiEmbedderConfig
+from graphiti_core.llm_client.config import DEFAULT_MAX_TOKENS, ModelSize
+from graphiti_core.llm_client.gemini_client import GeminiClient, LLMConfig
+from graphiti_core.prompts.models import Message
+from pydantic import BaseModel
+
+from utils import GEMINI_EMBED_RPM, GEMINI_EMBED_TPM, RateLimiter, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+
+
+class CachePolicy(str, Enum):
+    DISABLED = "disabled"  # always call the API, never touch the cache
+    ENABLED = "enabled"  # serve hits, store misses
+    READ_ONLY = "read_only"  # serve hits, never store
+    WRITE_ONLY = "write_only"  # always call the API and refresh the cache
+    REPLAY = "replay"  # serve hits only, a miss is an error
+
+
+CACHE_POLICY = CachePolicy(os.environ.get("CACHE_POLICY", CachePolicy.ENABLED.value))
+
+
+class ResponseCache:
+    """SQLite table of API responses keyed by a SHA256 of the request."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, policy: CachePolicy = CACHE_POLICY):
+        self.policy = policy
+        self._conn: sqlite3.Connection | None = None
+        if policy is not CachePolicy.DISABLED:
+            self._conn = sqlite3.connect(path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key BLOB PRIMARY KEY, response BLOB NOT NULL, created_at TEXT NOT NULL)"
+            )
+
+    @staticmethod
+    def key(*parts: typing.Any) -> bytes:
+        return hashlib.sha256(orjson.dumps(parts)).digest()
+
+    @property
+    def reads(self) -> bool:
+        return self.policy in (
+            CachePolicy.ENABLED,
+            CachePolicy.READ_ONLY,
+            CachePolicy.REPLAY,
+        )
+
+    @property
+    def writes(self) -> bool:
+        return self.policy in (CachePolicy.ENABLED, CachePolicy.WRITE_ONLY)
+
+    def get(self, key: bytes) -> typing.Any | None:
+        row = self._conn.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def set(self, key: bytes, value: typing.Any):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                (key, orjson.dumps(value), datetime.now(timezone.utc).isoformat()),
+            )
+
+    async def fetch(
+        self, key: bytes, compute: Callable[[], Awaitable[typing.Any]]
+    ) -> typing.Any:
+        """Returns the cached value for ``key`` or awaits ``compute`` per the policy."""
+        if self.reads:
+            value = self.get(key)
+            if value is not None:
+                logger.debug("Cache hit for %s", key.hex())
+                return value
+            if self.policy is CachePolicy.REPLAY:
+                raise LookupError(f"No cached response for {key.hex()} in replay mode")
+
+        value = await compute()
+        if self.writes:
+            self.set(key, value)
+        return value
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+def _embedding_tokens(input_data: typing.Any) -> int:
+    if isinstance(input_data, str):
+        return estimate_tokens(input_data)
+    total = 0
+    for item in input_data:
+        if isinstance(item, str):
+            total += estimate_tokens(item)
+        else:
+            # Token-id inputs are counted one token per id
+            total += len(item) if isinstance(item, list) else 1
+    return total
+
+
+class CachedGeminiClient(GeminiClient):
+    """GeminiClient that serves repeated prompts from a ResponseCache.
+
+    Only cache misses reach the API, and each API attempt first takes a slot
+    from ``rate_limiter`` so the Gemini quota holds however many calls one
+    episode makes.
+    """
+
+    def __init__(
+        self,
+        config: LLMConfig | None = None,
+        response_cache: ResponseCache | None = None,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        super().__init__(config, max_tokens=max_tokens)
+        self.response_cache = response_cache or ResponseCache()
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+    async def _generate_response(
+        self,
+        messages: list[Message],
+        response_model: type[BaseModel] | None = None,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        model_size: ModelSize = ModelSize.medium,
+    ) -> dict[str, typing.Any]:
+        await self.rate_limiter.acquire(
+            sum(estimate_tokens(m.content) for m in messages)
+        )
+        return await super()._generate_response(
+            messages, response_model, max_tokens, model_size
+        )
+
+    async def generate_response(
+        self,
+        messages: list[Message],
+        response_model: type[BaseModel] | None = None,
+        max_tokens: int | None = None,
+        model_size: ModelSize = ModelSize.medium,
+    ) -> dict[str, typing.Any]:
+        max_tokens = max_tokens or self.max_tokens
+        key = self.response_cache.key(
+            [(m.role, m.content) for m in messages],
+            response_model.model_json_schema() if response_model else None,
+            self.model,
+            "gemini",
+            self.temperature,
+            max_tokens,
+        )
+        return await self.response_cache.fetch(
+            key,
+            partial(
+                super().generate_response,
+                messages,
+                response_model=response_model,
+                max_tokens=max_tokens,
+                model_size=model_size,
+            ),
+        )
+
+
+class CachedGeminiEmbedder(GeminiEmbedder):
+    """GeminiEmbedder that serves repeated inputs from a ResponseCache.
+
+    Like CachedGeminiClient, only cache misses are rate limited, by default
+    against the embedding model's own quota.
+    """
+
+    def __init__(
+        self,
+        config: GeminiEmbedderConfig | None = None,
+        response_cache: ResponseCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        super().__init__(config)
+        self.response_cache = response_cache or ResponseCache()
+        self.rate_limiter = rate_limiter or RateLimiter(
+            GEMINI_EMBED_RPM, GEMINI_EMBED_TPM
+        )
+
+    def _key(self, input_data: typing.Any) -> bytes:
+        return self.response_cache.key(
+            input_data,
+            self.config.embedding_model,
+            "gemini",
+            self.config.embedding_dim,
+        )
+
+    async def create(
+        self, input_data: str | list[str] | Iterable[int] | Iterable[Iterable[int]]
+    ) -> list[float]:
+        if not isinstance(input_data, (str, list)):
+            input_data = [
+                list(item) if isinstance(item, Iterable) else item
+                for item in input_data
+            ]
+        return await self.response_cache.fetch(
+            self._key(input_data), partial(self._create, input_data)
+        )
+
+    async def _create(self, input_data: typing.Any) -> list[float]:
+        await self.rate_limiter.acquire(_embedding_tokens(input_data))
+        return await super().create(input_data)
+
+    async def create_batch(self, input_data_list: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in input_data_list]
+        embeddings: list[list[float] | None] = [None] * len(keys)
+        if self.response_cache.reads:
+            embeddings = [self.response_cache.get(key) for key in keys]
+
+        # Only send the texts we have not embedded before
+        misses = [i for i, emb in enumerate(embeddings) if emb is None]
+        if misses and self.response_cache.policy is CachePolicy.REPLAY:
+            raise LookupError(
+                f"No cached embedding for {len(misses)} inputs in replay mode"
+            )
+        if misses:
+            texts = [input_data_list[i] for i in misses]
+            await self.rate_limiter.acquire(_embedding_tokens(texts))
+            fresh = await super().create_batch(texts)
+            for i, emb in zip(misses, fresh):
+                embeddings[i] = emb
+                if self.response_cache.writes:
+                    self.response_cache.set(keys[i], emb)
+        return embeddings
@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections.abc import Iterable
+from itertools import batched
+from typing import Any, Dict
+
+from fastmcp import Client
+from fastmcp.client import SSETransport
+
+from utils import MAX_CONCURRENT_EPISODES, debug_json, write_json
+
+GRAPHITI_SERVER_URL = os.environ.get("GRAPHITI_SERVER_URL", "http://localhost:8000/sse")
+
+_REQUIRED_EPISODE_ARGS = frozenset(
+    ("name", "episode_body", "source", "source_description")
+)
+
+_client: Client | None = None
+_client_lock = asyncio.Lock()
+# Whether the server exposes 'add_episodes_bulk'; looked up once per session
+_has_bulk_add: bool | None = None
+
+
+async def get_client() -> Client:
+    """Returns the process-wide client, creating it on first use."""
+    global _client
+    async with _client_lock:
+        if _client is None:
+            # The Client will infer the transport based on the URL
+            _client = Client(SSETransport(GRAPHITI_SERVER_URL))
+        return _client
+
+
+async def _supports_bulk_add(client: Client) -> bool:
+    global _has_bulk_add
+    if _has_bulk_add is None:
+        tools = await client.list_tools()
+        _has_bulk_add = any(tool.name == "add_episodes_bulk" for tool in tools)
+    return _has_bulk_add
+
+
+def episode_arguments(
+    name: str,
+    episode_body: str,
+    group_id: str | None = None,
+    source: str = "text",
+    source_description: str = "",
+    uuid: str | None = None,
+) -> Dict[str, Any]:
+    # Prepare the arguments for the 'add_memory' tool
+    # Note: The server code expects a dict, so we pass a dict.
+    # FastMCP handles the JSON-RPC parameter mapping.
+    # Built in one pass; optional arguments are left out when unset.
+    return {
+        k: v
+        for k, v in (
+            ("name", name),
+            ("episode_body", episode_body),
+            ("source", source),
+            ("source_description", source_description),
+            ("group_id", group_id),
+            ("uuid", uuid),
+        )
+        if v is not None or k in _REQUIRED_EPISODE_ARGS
+    }
+
+
+async def _call_add(client: Client, arguments: Dict[str, Any]) -> Any:
+    debug_json("Calling 'add_memory' with arguments", arguments)
+    response = await client.call_tool("add_memory", arguments)
+    debug_json("Received response", response)
+    print(f"Added episode: {arguments['name']}")
+    return response
+
+
+async def add_graphiti_episodes(
+    client: Client,
+    episodes: Iterable[Dict[str, Any]],
+    concurrency: int = MAX_CONCURRENT_EPISODES,
+):
+    """Adds all episodes over the already connected client session.
+
+    Uses the server's 'add_episodes_bulk' tool when it is exposed, one call per
+    ``concurrency`` episodes; otherwise ``concurrency`` workers pull episodes
+    from the iterable and issue one 'add_memory' call each, so a slow episode
+    only holds up its own worker.
+    """
+    try:
+        if await _supports_bulk_add(client):
+            for batch in batched(episodes, concurrency):
+                arguments: Dict[str, Any] = {"episodes": list(batch)}
+                debug_json("Calling 'add_episodes_bulk' with arguments", arguments)
+                response = await client.call_tool("add_episodes_bulk", arguments)
+                debug_json("Received response", response)
+                for episode in batch:
+                    print(f"Added episode: {episode['name']}")
+        else:
+            pending = iter(episodes)
+
+            async def _worker():
+                for arguments in pending:
+                    await _call_add(client, arguments)
+
+            # The first failure cancels the other workers before the session closes
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    for _ in range(concurrency):
+                        tg.create_task(_worker())
+            except ExceptionGroup as eg:
+                raise eg.exceptions[0] from None
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise
+
+
+async def search_graphiti_episode(
+    client: Client,
+    query: str,
+) -> Dict[str, Any]:
+    try:
+        arguments: Dict[str, Any] = {
+            "query": query,
+            "group_ids": [],
+            "max_nodes": 10,
+            "center_node_uuid": "",
+            "entity": "",
+        }
+
+        debug_json("Calling 'search_memory_nodes' with arguments", arguments)
+
+        response = await client.call_tool("search_memory_nodes", arguments)
+        # The search result is the output of this action, so it is always shown
+        write_json("Received response", response)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise
+
+
+async def clear_db(client: Client):
+    resp = await client.call_tool("clear_graph")
@@ -1,116 +1,335 @@
+import asyncio
+import base64
 import csv
+import hashlib
+import logging
 import os
-from pprint import pprint
-from typing import Any, Dict, List, Union
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Union
 
 import litellm
+import numpy as np
 import openai.types.chat  # Import chat types for type hinting
+import orjson
 # Assuming 'studio_key' is defined in a 'utils.py' file
 # from utils import studio_key
 import tiktoken
 # Ensure you have the necessary environment variables or a utils.py with studio_key
 # For demonstration, I'll use a placeholder if studio_key is not available
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from quart import Quart, Response, request
 
 load_dotenv()
 studio_key = os.environ["GEMINI_API_KEY"]
 
 
-app = Flask(__name__)
+# The root logger stays at WARNING so LiteLLM's own INFO logging stays quiet;
+# LOG_LEVEL only applies to this module's logger.
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+app = Quart(__name__)
 # Configure your litellm credentials (if required for Google Gemini)
 litellm.api_key = studio_key
-os.environ["LITELLM_LOG"] = "DEBUG"  # Keep for debugging LiteLLM calls
+# For debugging LiteLLM calls, run with LITELLM_LOG=DEBUG; it logs full
+# requests and responses, so it stays off by default.
+
+# Tokenizer for decoding token inputs, loaded once instead of per request.
+# Note: Decoding tokens from one model might not be accurate for another model's tokenizer.
+# text-embedding-ada-002 is a common baseline.
+try:
+    _TOKENIZER = tiktoken.encoding_for_model("text-embedding-ada-002")
+except Exception as e:
+    logger.warning("Could not load tiktoken encoding: %s", e)
+    _TOKENIZER = None
+
+# Message roles accepted by /chat/completions
+_VALID_ROLES = frozenset(("system", "user", "assistant", "tool"))
+
+# /embeddings output encodings: "float" is a JSON list, "base64" is OpenAI's
+# base64 of little-endian float32, and "float16" is base64 of float16 (half the bytes)
+_EMBEDDING_DTYPES = {"base64": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+def _orjson_response(obj: Any, status: int = 200):
+    """Serializes ``obj`` with orjson, bypassing Quart's stdlib-json jsonify."""
+    return app.response_class(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def _encode_embeddings(
+    embeddings: List[np.ndarray], encoding_format: str
+) -> Union[List[np.ndarray], List[str]]:
+    """Encodes a batch of embeddings through a single float32 matrix."""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    dtype = _EMBEDDING_DTYPES.get(encoding_format)
+    if dtype is None:
+        # Row views; orjson writes them in their shortest float32 form
+        return list(matrix)
+    # One cast for the whole batch; each row is a contiguous buffer
+    return [base64.b64encode(row).decode() for row in matrix.astype(dtype, copy=False)]
+
+
+async def _sse_frames(stream) -> AsyncIterator[bytes]:
+    """Yields OpenAI-style ``data:`` frames, already encoded, for each chunk."""
+    async for chunk in stream:
+        # pydantic-core serializes straight to JSON, skipping the dict round trip
+        yield b"data: " + chunk.model_dump_json().encode() + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
+
+class EmbeddingBatcher:
+    """Coalesces texts from concurrent /embeddings requests into batched upstream calls.
+
+    Texts queued within ``max_wait`` seconds of each other (up to ``max_batch``
+    of them) share a single ``litellm.aembedding`` call. Each caller gets its
+    own embeddings back plus a share of the batch's prompt tokens, split by
+    text length.
+
+    Embeddings are also kept in an LRU of up to ``cache_size`` entries keyed by
+    a BLAKE2b digest of (model, text); repeated texts never leave the process.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_batch: int = 64,
+        max_wait: float = 0.005,
+        cache_size: int = 10_000,
+    ):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        # Stored as float32 arrays (~3 KB per 768-dim vector) rather than lists
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(
+            f"{self.model}\0{text}".encode(), digest_size=16
+        ).digest()
+
+    def _remember(self, key: bytes, embedding: List[float]) -> np.ndarray:
+        # Misses hand back the stored vector too, so a text always gets the
+        # same float32 embedding whether or not it was cached
+        self._cache[key] = vector = np.asarray(embedding, dtype=np.float32)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return vector
+
+    async def embed(self, texts: List[str]) -> List[tuple[np.ndarray, int]]:
+        """Returns ``(embedding, prompt_tokens)`` for each text, in order.
+
+        Embeddings are float32 arrays. Cache hits cost no upstream tokens and
+        are reported as 0.
+        """
+        results: List[tuple[np.ndarray, int] | None] = [None] * len(texts)
+        misses = []
+        for i, text in enumerate(texts):
+            key = self._key(text)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                results[i] = (cached, 0)
+            else:
+                misses.append((i, key, text))
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in misses]
+        for (_, _, text), future in zip(misses, futures):
+            self._queue.put_nowait((text, future))
+        for (i, key, _), (embedding, tokens) in zip(
+            misses, await asyncio.gather(*futures)
+        ):
+            results[i] = (self._remember(key, embedding), tokens)
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            # Flush in the background so the next batch starts collecting right away
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            response = await litellm.aembedding(
+                model=self.model,
+                input=texts,  # LiteLLM expects a list of strings here
+            )
+            # Match results by position: some providers (LiteLLM's gemini/
+            # transform among them) report index 0 for every item
+            if len(response.data) != len(batch):
+                raise RuntimeError(
+                    f"Embedding provider returned {len(response.data)} results "
+                    f"for {len(batch)} inputs"
+                )
+            prompt_tokens = response.usage.prompt_tokens if response.usage else 0
+            total_chars = sum(len(text) for text in texts) or 1
+            for (text, future), item in zip(batch, response.data):
+                if not future.done():
+                    future.set_result(
+                        (item.embedding, round(prompt_tokens * len(text) / total_chars))
+                    )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Never leave a caller waiting, e.g. when the flush was cancelled
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Embedding flush was cancelled"))
+
+
+_EMBEDDING_MODEL = "gemini/text-embedding-004"  # Default embedding model for LiteLLM
+_embedding_batcher = EmbeddingBatcher(
+    _EMBEDDING_MODEL,
+    max_batch=int(os.environ.get("EMBEDDING_BATCH_SIZE", "64")),
+    max_wait=int(os.environ.get("EMBEDDING_BATCH_WAIT_MS", "5")) / 1000,
+    cache_size=int(os.environ.get("EMBEDDING_CACHE_SIZE", "10000")),
+)
+
+
+@app.before_serving
+async def _start_embedding_batcher():
+    await _embedding_batcher.start()
+
+
+@app.after_serving
+async def _shutdown():
+    await _embedding_batcher.stop()
 
 
 # Define route for the Embeddings endpoint
 @app.route("/embeddings", methods=["POST"])
-def embeddings():
+async def embeddings():
     try:
         # Parse the request payload
-        payload = request.json
-        print("Embeddings endpoint received payload:", payload)
+        payload = orjson.loads(await request.get_data())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Embeddings endpoint received payload: %s", payload)
         # Expects input as a list of strings or list of lists of integers
         input_data = payload.get("input", [])
         # model = payload.get(
         #     "model", "gemini/text-embedding-004"
         # )  # Default embedding model for LiteLLM
 
-        model: str = "gemini/text-embedding-004"
+        model: str = _EMBEDDING_MODEL
         if not input_data:
-            return jsonify({"error": "Input text is required"}), 400
+            return _orjson_response({"error": "Input text is required"}, 400)
+
+        encoding_format: str = payload.get("encoding_format") or "float"
+        if encoding_format != "float" and encoding_format not in _EMBEDDING_DTYPES:
+            return _orjson_response(
+                {"error": "encoding_format must be one of: float, base64, float16"}, 400
+            )
 
-        # Determine if input is tokens (list of lists of ints) or strings (list of strings)
+        # Determine if input is tokens (list of lists of ints) or strings (list of strings).
+        # input_data is known to be non-empty here, so only the first item needs checking.
         is_token_input = (
-            isinstance(input_data, list)
-            and input_data
-            and isinstance(input_data[0], list)
+            isinstance(input_data[0], list)
             and input_data[0]
             and isinstance(input_data[0][0], int)
         )
 
         decoded_texts = []
         if is_token_input:
-            # Initialize the tokenizer (Assuming a common tokenizer like GPT-4 for decoding tokens)
-            # Note: Decoding tokens from one model might not be accurate for another model's tokenizer.
             # If your input tokens come from a specific model, use that model's tokenizer if available.
-            # text-embedding-ada-002 is a common baseline.
             try:
-                tokenizer = tiktoken.encoding_for_model("text-embedding-ada-002")
-                decoded_texts = [
-                    tokenizer.decode(token_list) for token_list in input_data
-                ]
-                print(f"Decoded string from tokens: {decoded_texts}")
+                if _TOKENIZER is None:
+                    raise RuntimeError("tiktoken encoding is not available")
+                if len(input_data) == 1:
+                    decoded_texts = [_TOKENIZER.decode(input_data[0])]
+                else:
+                    # decode_batch builds and joins a thread pool; keep that
+                    # off the event loop
+                    decoded_texts = await asyncio.to_thread(
+                        _TOKENIZER.decode_batch, input_data
+                    )
+                logger.debug("Decoded string from tokens: %s", decoded_texts)
             except Exception as e:
-                print(
-                    f"Warning: Could not decode tokens using tiktoken: {e}. Treating input as strings."
+                logger.warning(
+                    "Could not decode tokens using tiktoken: %s. Treating input as strings.",
+                    e,
                 )
                 decoded_texts = input_data  # Fallback to treating as strings
 
+        elif isinstance(input_data, str):
+            # A single string is a batch of one
+            decoded_texts = [input_data]
         else:
             # Input is already a list of strings
             decoded_texts = input_data
-            print(f"Input treated as strings: {decoded_texts}")
+            logger.debug("Input treated as strings: %s", decoded_texts)
 
-        # Use litellm to call the embedding model
-        response = litellm.embedding(
-            model=model,
-            input=decoded_texts,  # LiteLLM expects a list of strings here
-        )
-
-        embeddings = [item.embedding for item in response.data]
+        # Use litellm to call the embedding model, batched with concurrent requests
+        results = await _embedding_batcher.embed(decoded_texts)
 
+        encoded = _encode_embeddings([emb for emb, _ in results], encoding_format)
         formatted_data = [
             {"object": "embedding", "embedding": emb, "index": i}
-            for i, emb in enumerate(embeddings)
+            for i, emb in enumerate(encoded)
         ]
+        prompt_tokens = sum(tokens for _, tokens in results)
 
-        return jsonify(
+        return _orjson_response(
             {
                 "object": "list",
                 "model": model,
                 "data": formatted_data,
-                "usage": (
-                    response.usage.model_dump() if response.usage else {}
-                ),  # Include usage if available
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "total_tokens": prompt_tokens,
+                },
             }
         )
 
     except Exception as e:
         # Handle errors
-        print("Error in /embeddings:", e)
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error in /embeddings: %s", e)
+        return _orjson_response({"error": str(e)}, 500)
 
 
 # Define route for the Chat Completions endpoint
 @app.route("/chat/completions", methods=["POST"])
-def chat_completions():
+async def chat_completions():
     try:
         # Parse the request payload
-        payload = request.json
-        print("\nChat completions endpoint received payload:\n")
-        print("-" * 80 + "\n")
-        pprint(payload)
+        payload = orjson.loads(await request.get_data())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Chat completions endpoint received payload: %s", payload)
 
         # Extract required parameters
         messages: List[Dict[str, str]] = payload.get("messages")
@@ -120,7 +339,7 @@ def chat_completions():
         model: str = "gemini/gemini-2.0-flash-lite"
 
         if not messages:
-            return jsonify({"error": "Messages are required"}), 400
+            return _orjson_response({"error": "Messages are required"}, 400)
 
         # Optional parameters (mimicking OpenAI)
         temperature: float = payload.get("temperature", 1.0)
@@ -132,16 +351,13 @@ def chat_completions():
         # Prepare messages for LiteLLM. LiteLLM usually accepts the same format
         # as OpenAI Chat Completions API (list of role/content dicts).
         # Ensure roles are valid (system, user, assistant, tool)
-        valid_roles = ["system", "user", "assistant", "tool"]
-        cleaned_messages = [msg for msg in messages if msg.get("role") in valid_roles]
+        cleaned_messages = [msg for msg in messages if msg.get("role") in _VALID_ROLES]
 
         if not cleaned_messages:
-            return (
-                jsonify(
-                    {
-                        "error": "Valid messages with roles (system, user, assistant, tool) are required"
-                    }
-                ),
+            return _orjson_response(
+                {
+                    "error": "Valid messages with roles (system, user, assistant, tool) are required"
+                },
                 400,
             )
 
@@ -152,50 +368,48 @@ def chat_completions():
             "temperature": temperature,
             "top_p": top_p,
             # Add other parameters like frequency_penalty, presence_penalty, stop, etc.
-            # "stream": payload.get("stream", False), # Handle streaming if needed
         }
         if max_tokens is not None:
             litellm_params["max_tokens"] = max_tokens
 
-        # If streaming is requested, we need to handle it differently
+        # If streaming is requested, forward LiteLLM's chunks as server-sent events
         if payload.get("stream", False):
-            # LiteLLM can stream, but Flask needs to handle the stream response.
-            # This requires using Flask's streaming capabilities or a library like flask-streaming.
-            # For simplicity, let's implement non-streaming first.
-            # Implementing streaming in Flask requires returning a generator or using a streaming extension.
-            # We'll add a basic placeholder for streaming response.
-            return (
-                jsonify({"error": "Streaming is not yet implemented on this server"}),
-                501,
+            stream = await litellm.acompletion(**litellm_params, stream=True)
+            streaming_response = Response(
+                _sse_frames(stream),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
             )
+            # Long generations must not hit Quart's default response timeout
+            streaming_response.timeout = None
+            return streaming_response
 
         # Non-streaming call
-        response: openai.types.chat.ChatCompletion = litellm.completion(
+        response: openai.types.chat.ChatCompletion = await litellm.acompletion(
             **litellm_params
         )
 
-        # Format the response to mimic OpenAI's API
-        # LiteLLM's response object is usually compatible with OpenAI's format
-        # It should be a ChatCompletion object or similar dictionary structure
-        formatted_response: Dict[str, Any] = (
-            response.model_dump()
-        )  # Use model_dump for Pydantic models
-
-        return jsonify(formatted_response)
+        # LiteLLM's response object is usually compatible with OpenAI's format,
+        # so serialize the pydantic model as-is instead of dumping it to a dict
+        return app.response_class(
+            response.model_dump_json(), mimetype="application/json"
+        )
 
     except Exception as e:
         # Handle errors
-        print("Error in /chat/completions:", e)
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error in /chat/completions: %s", e)
+        return _orjson_response({"error": str(e)}, 500)
 
 
 if __name__ == "__main__":
-    # Ensure you have LiteLLM and Flask installed:
-    # pip install litellm flask openai tiktoken
+    # Ensure you have LiteLLM and Quart installed:
+    # pip install litellm quart openai tiktoken
     # Also install the necessary providers for LiteLLM (e.g., `pip install openai google-generativeai`)
 
     # Set the LITELLM_STUDIO_KEY environment variable, or define it in utils.py
     # export LITELLM_STUDIO_KEY='your_key_here'
 
-    print("Starting Flask server...")
-    app.run(port=5000, debug=True)
+    # This is Quart's development server; for real workloads run under uvicorn:
+    #   uvicorn server:app --port 5000 --workers 4 --loop uvloop
+    print("Starting Quart server...")
+    app.run(port=5000)
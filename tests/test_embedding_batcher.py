@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+import httpx
+import orjson
+import pytest
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def gemini_calls(monkeypatch):
+    """Replaces the Gemini batchEmbedContents call with a canned response.
+
+    LiteLLM's own gemini/ transform still builds the EmbeddingResponse, so the
+    batcher sees the real response shape (every item reports index 0).
+    Embeddings are ``[len(text), position in upstream batch]``.
+    """
+    calls = []
+
+    async def post(self, url, data=None, **kwargs):
+        requests = orjson.loads(data)["requests"]
+        texts = [r["content"]["parts"][0]["text"] for r in requests]
+        calls.append(texts)
+        return httpx.Response(
+            200,
+            json={
+                "embeddings": [
+                    {"values": [float(len(text)), float(i)]}
+                    for i, text in enumerate(texts)
+                ]
+            },
+            request=httpx.Request("POST", url),
+        )
+
+    monkeypatch.setattr(AsyncHTTPHandler, "post", post)
+    monkeypatch.setattr(
+        server,
+        "_embedding_batcher",
+        server.EmbeddingBatcher(server._EMBEDDING_MODEL, max_wait=0.05),
+    )
+    return calls
+
+
+async def _post(client, body):
+    response = await client.post("/embeddings", json=body)
+    return response.status_code, await response.get_json()
+
+
+def test_multi_text_request(gemini_calls):
+    async def run():
+        async with server.app.test_app() as app:
+            return await _post(app.test_client(), {"input": ["a", "bb", "ccc"]})
+
+    status, body = asyncio.run(run())
+
+    assert status == 200
+    assert [item["embedding"] for item in body["data"]] == [
+        [1.0, 0.0],
+        [2.0, 1.0],
+        [3.0, 2.0],
+    ]
+    assert [item["index"] for item in body["data"]] == [0, 1, 2]
+    assert gemini_calls == [["a", "bb", "ccc"]]
+
+
+def test_concurrent_requests_are_coalesced(gemini_calls):
+    async def run():
+        async with server.app.test_app() as app:
+            client = app.test_client()
+            return await asyncio.gather(
+                *(_post(client, {"input": text}) for text in ("a", "bb", "ccc"))
+            )
+
+    results = asyncio.run(run())
+
+    assert [status for status, _ in results] == [200, 200, 200]
+    # Each caller gets the vector for its own text, from one upstream call
+    assert [body["data"][0]["embedding"][0] for _, body in results] == [1.0, 2.0, 3.0]
+    assert len(gemini_calls) == 1
+    assert sorted(gemini_calls[0]) == ["a", "bb", "ccc"]
+
+
+def test_cache_hit_returns_same_vector(gemini_calls):
+    async def run():
+        async with server.app.test_app() as app:
+            client = app.test_client()
+            first = await _post(client, {"input": ["a", "bb"]})
+            second = await _post(client, {"input": ["bb"]})
+            return first, second
+
+    (_, first), (_, second) = asyncio.run(run())
+
+    assert second["data"][0]["embedding"] == first["data"][1]["embedding"]
+    assert second["usage"]["prompt_tokens"] == 0
+    assert len(gemini_calls) == 1
+
+
+@pytest.mark.skipif(server._TOKENIZER is None, reason="tiktoken encoding unavailable")
+@pytest.mark.parametrize("texts", [["hello world"], ["hello world", "bye"]])
+def test_token_input_is_decoded(gemini_calls, texts):
+    tokens = [server._TOKENIZER.encode(text) for text in texts]
+
+    async def run():
+        async with server.app.test_app() as app:
+            return await _post(app.test_client(), {"input": tokens})
+
+    status, _ = asyncio.run(run())
+
+    assert status == 200
+    assert gemini_calls == [texts]
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import sys
+import time
+import uuid
+from collections.abc import Coroutine, Iterable, Iterator
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any
+
+import ijson
+import orjson
+from dotenv import load_dotenv
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+# Settings below, and in modules importing this one, may come from .env
+load_dotenv()
+
+# Gemini free-tier quotas for gemini-2.0-flash; override for paid tiers
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))
+# Embedding models have their own, much larger quota; graphiti embeds every
+# extracted node and edge separately
+GEMINI_EMBED_RPM = int(os.environ.get("GEMINI_EMBED_RPM", "1500"))
+GEMINI_EMBED_TPM = int(os.environ.get("GEMINI_EMBED_TPM", "1000000"))
+
+# Upper bound on episodes being ingested at the same time
+MAX_CONCURRENT_EPISODES = int(os.environ.get("MAX_CONCURRENT_EPISODES", "8"))
+
+# Dump tool-call arguments and responses to stdout
+DEBUG = os.environ.get("DEBUG", "").lower() in ("1", "true")
+
+# Optional JSON array or NDJSON file to ingest instead of the built-in episodes
+EPISODES_PATH = os.environ.get("EPISODES_PATH")
+
+
+def _default(o: Any) -> Any:
+    """Serialize values orjson does not handle natively."""
+    if isinstance(o, Decimal):
+        return str(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Type is not JSON serializable: {type(o).__name__}")
+
+
+def _dumps(o: Any) -> str:
+    return orjson.dumps(o, default=_default).decode()
+
+
+def _default_repr(o: Any) -> Any:
+    # MCP responses are lists of pydantic content models
+    if hasattr(o, "model_dump"):
+        return o.model_dump()
+    return str(o)
+
+
+def write_json(label: str, obj: Any):
+    """Writes ``label: <obj as JSON>`` straight to stdout as UTF-8 bytes."""
+    sys.stdout.flush()
+    sys.stdout.buffer.write(
+        label.encode() + b": " + orjson.dumps(obj, default=_default_repr) + b"\n"
+    )
+    sys.stdout.buffer.flush()
+
+
+def debug_json(label: str, obj: Any):
+    """Like ``write_json``, but only when DEBUG is set."""
+    if DEBUG:
+        write_json(label, obj)
+
+
+def as_episode_body(content: Any) -> str:
+    """Returns episode content as the string graphiti expects.
+
+    Strings pass through untouched; only structured content is JSON-encoded.
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, bytes):
+        return content.decode()
+    return _dumps(content)
+
+
+def normalize_bodies(
+    episodes: Iterable[dict[str, Any]], content_key: str
+) -> Iterator[dict[str, Any]]:
+    """Yields each episode with ``content_key`` coerced to a string body.
+
+    Episodes whose content is already a string are passed through as-is.
+    """
+    for episode in episodes:
+        if isinstance(episode[content_key], str):
+            yield episode
+        else:
+            yield {**episode, content_key: as_episode_body(episode[content_key])}
+
+
+def iter_episodes(path: str) -> Iterator[dict[str, Any]]:
+    """Streams episodes from a JSON array or NDJSON file one record at a time.
+
+    Files ending in ``.ndjson`` or ``.jsonl`` are read line by line; anything
+    else is parsed incrementally as a top-level JSON array. Memory stays bounded
+    by a single record regardless of file size.
+    """
+    with open(path, "rb") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+        else:
+            # use_float keeps numbers JSON-serializable instead of Decimal
+            yield from ijson.items(f, "item", use_float=True)
+
+
+def run(main: Coroutine[Any, Any, Any]) -> Any:
+    """Runs ``main`` on uvloop when it is installed, else on the default loop."""
+    if uvloop is not None:
+        return uvloop.run(main)
+    return asyncio.run(main)
+
+
+def new_uuids(n: int) -> list[str]:
+    """Returns ``n`` random version-4 UUID strings from a single urandom read."""
+    buf = os.urandom(16 * n)
+    return [
+        str(uuid.UUID(bytes=buf[i : i + 16], version=4)) for i in range(0, 16 * n, 16)
+    ]
+
+
+def reference_time() -> datetime:
+    """Returns the reference time for a batch of episodes.
+
+    Take it once per batch, not per episode: graphiti puts the reference time
+    in its prompts, so sharing one keeps those prompts, and their response
+    cache keys, identical across the batch.
+    """
+    return datetime.now(timezone.utc)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for TPM budgeting."""
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """Token bucket enforcing requests-per-minute and tokens-per-minute quotas.
+
+    Both buckets start full and refill continuously. ``acquire`` waits until
+    one request and ``tokens`` tokens are available, then consumes them.
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int = 1):
+        # A single request larger than the whole bucket would never fit
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                )
+                await asyncio.sleep(wait)